@@ -4,14 +4,21 @@ from __future__ import annotations
 
 import base64
 import hashlib
+import hmac
 import os
+import queue
 import secrets
-from urllib.parse import quote, urlparse
+import threading
+from urllib.parse import quote
 
-from flask import Flask, Response, jsonify, redirect, request, session, url_for
+import orjson
+from flask import Flask, Response, redirect, request, session
+
+from .sessions import FastSessionInterface
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("APP_SECRET_KEY", secrets.token_hex(16))
+app.session_interface = FastSessionInterface()
 
 DEFAULT_REDIRECT_URI = "https://localhost:8888/callback"
 CLIENT_ID = os.environ.get("SPOTIFY_CLIENT_ID")
@@ -40,29 +47,102 @@ DEFAULT_SCOPES = " ".join(
 REDIRECT_URI = os.environ.get("SPOTIFY_REDIRECT_URI", DEFAULT_REDIRECT_URI)
 SCOPES = os.environ.get("SPOTIFY_SCOPES", DEFAULT_SCOPES)
 
-parsed_redirect = urlparse(REDIRECT_URI)
-DEFAULT_PORT = parsed_redirect.port or (443 if parsed_redirect.scheme == "https" else 80)
+
+def _default_port(uri: str) -> int:
+    """Return the port in ``uri`` or the scheme default, as ``urlparse(uri).port or 443/80``."""
+    # The authority ends at the first "/", "?" or "#"; userinfo and IPv6 brackets precede
+    # the port.
+    authority = uri.partition("://")[2]
+    for delim in "/?#":
+        authority = authority.partition(delim)[0]
+    _, sep, port = authority.rpartition("@")[2].rpartition("]")[2].rpartition(":")
+    if sep and port:
+        if not (port.isascii() and port.isdigit()) or int(port) > 65535:
+            raise ValueError(f"Invalid port in redirect URI: {uri!r}")
+        if int(port):
+            return int(port)
+    return 443 if uri[:8].lower() == "https://" else 80
+
+
+USE_ADHOC_HTTPS = REDIRECT_URI[:8].lower() == "https://"
+DEFAULT_PORT = _default_port(REDIRECT_URI)
 SERVER_PORT = int(os.environ.get("PORT", DEFAULT_PORT))
-USE_ADHOC_HTTPS = parsed_redirect.scheme == "https"
 
+_REDIRECT_URI_Q = quote(REDIRECT_URI)
+_SCOPES_Q = quote(SCOPES)
+_AUTH_URL_TMPL = (
+    "https://accounts.spotify.com/authorize?response_type=code&client_id={cid}&scope={sc}"
+    "&redirect_uri={ru}&state={st}&code_challenge_method=S256&code_challenge={ch}"
+)
 
-def _generate_verifier() -> str:
-    return base64.urlsafe_b64encode(secrets.token_bytes(64)).rstrip(b"=").decode()
+_PKCE_RAW_SIZE = 48
+_PKCE_BATCH_SIZE = 32
 
 
-def _generate_challenge(verifier: str) -> str:
-    digest = hashlib.sha256(verifier.encode()).digest()
-    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+def _encode_state_and_verifier(raw: bytes, _b64=base64.urlsafe_b64encode) -> tuple[str, str]:
+    # 16 bytes for the state (22 characters, as token_urlsafe(16)) and 32 bytes for the
+    # verifier (the RFC 7636 minimum of 43 characters). Slicing drops the base64 padding.
+    state = _b64(raw[:16]).decode("ascii")[:22]
+    verifier = _b64(raw[16:]).decode("ascii")[:43]
+    return state, verifier
 
 
-@app.route("/")
-def index() -> Response:
-    if not CLIENT_ID:
-        missing = "SPOTIFY_CLIENT_ID"
-    else:
-        missing = None
+def _generate_challenge(
+    verifier: str, _sha=hashlib.sha256, _b64=base64.urlsafe_b64encode
+) -> str:
+    digest = _sha(verifier.encode("ascii")).digest()
+    # A 32-byte digest always encodes to 43 characters plus one "=" of padding.
+    return _b64(digest)[:43].decode("ascii")
+
+
+def _make_pkce_batch(count: int, _rnd=secrets.token_bytes) -> list[tuple[str, str, str]]:
+    """Return ``count`` (state, verifier, challenge) triples from a single CSPRNG draw.
+
+    Underscore-prefixed defaults bind hot-path callables as locals; callers never pass them.
+    """
+    raw = _rnd(_PKCE_RAW_SIZE * count)
+    batch = []
+    for offset in range(0, len(raw), _PKCE_RAW_SIZE):
+        state, verifier = _encode_state_and_verifier(raw[offset : offset + _PKCE_RAW_SIZE])
+        batch.append((state, verifier, _generate_challenge(verifier)))
+    return batch
+
+
+def _make_pkce_params() -> tuple[str, str, str]:
+    return _make_pkce_batch(1)[0]
+
+
+# Pre-generated (state, verifier, challenge) triples so /login normally takes ready-made
+# values instead of generating them inline. Importing this module starts the daemon
+# filler thread (in tests, wsgi, or a preloading server master alike), and each forked
+# child starts its own.
+_pkce_pool: queue.Queue[tuple[str, str, str]]
+
 
-    content = f"""
+def _fill_pkce_pool(pool: queue.Queue[tuple[str, str, str]]) -> None:
+    while True:
+        for params in _make_pkce_batch(_PKCE_BATCH_SIZE):
+            pool.put(params)
+
+
+def _start_pkce_pool() -> None:
+    # Also runs in forked children: an inherited pool would hand the parent's secrets to
+    # every worker, and its lock may have been held by the parent's filler thread.
+    global _pkce_pool
+    _pkce_pool = queue.Queue(maxsize=256)
+    threading.Thread(
+        target=_fill_pkce_pool, args=(_pkce_pool,), name="pkce-pool", daemon=True
+    ).start()
+
+
+_start_pkce_pool()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_start_pkce_pool)
+
+
+def _render_index() -> str:
+    missing = None if CLIENT_ID else "SPOTIFY_CLIENT_ID"
+    return f"""
     <html>
         <head><title>Spotify PKCE Helper</title></head>
         <body>
@@ -75,7 +155,7 @@ def index() -> Response:
                 <li><strong>Server port:</strong> {SERVER_PORT}</li>
                 <li><strong>HTTPS (adhoc certificate):</strong> {USE_ADHOC_HTTPS}</li>
             </ul>
-            <form method="post" action="{url_for('start_auth')}">
+            <form method="post" action="/login">
                 <div>
                     <label for="client_id">Client ID</label><br />
                     <input name="client_id" id="client_id" type="text" value="{CLIENT_ID or ''}" required />
@@ -96,21 +176,49 @@ def index() -> Response:
         </body>
     </html>
     """
-    return Response(content, mimetype="text/html")
+
+
+# The page only depends on module-level config, so it is rendered once. Browsers must
+# revalidate it so a restart with new env vars is picked up; the ETag makes that a 304.
+# When the form echoes CLIENT_SECRET the page must not be stored by any cache.
+_INDEX_BYTES = _render_index().encode("utf-8")
+_INDEX_ETAG = hashlib.sha256(_INDEX_BYTES).hexdigest()
+
+
+@app.route("/")
+def index() -> Response:
+    response = Response(_INDEX_BYTES, mimetype="text/html")
+    if CLIENT_SECRET:
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(_INDEX_ETAG)
+    return response.make_conditional(request)
+
+
+_ERR_CLIENT_ID = orjson.dumps({"error": "SPOTIFY_CLIENT_ID is not configured."})
+_ERR_STATE = orjson.dumps({"error": "Invalid or missing state parameter."})
+_ERR_CODE = orjson.dumps({"error": "Authorization code not found in callback."})
+
+
+def _json_response(body: bytes, status: int = 200) -> Response:
+    return Response(body, status=status, mimetype="application/json")
 
 
 @app.route("/login", methods=["GET", "POST"])
 def start_auth():
-    client_id = (request.form.get("client_id") or CLIENT_ID or "").strip()
-    client_secret = (request.form.get("client_secret") or CLIENT_SECRET or "").strip()
-    scopes = (request.form.get("scopes") or SCOPES or "").strip()
+    form = request.form
+    client_id = (form.get("client_id") or CLIENT_ID or "").strip()
+    client_secret = (form.get("client_secret") or CLIENT_SECRET or "").strip()
+    scopes = (form.get("scopes") or SCOPES or "").strip()
 
     if not client_id:
-        return jsonify({"error": "SPOTIFY_CLIENT_ID is not configured."}), 400
+        return _json_response(_ERR_CLIENT_ID, 400)
 
-    state = secrets.token_urlsafe(16)
-    verifier = _generate_verifier()
-    challenge = _generate_challenge(verifier)
+    try:
+        state, verifier, challenge = _pkce_pool.get_nowait()
+    except queue.Empty:
+        state, verifier, challenge = _make_pkce_params()
 
     session["state"] = state
     session["verifier"] = verifier
@@ -118,14 +226,10 @@ def start_auth():
     session["client_secret"] = client_secret
     session["scopes"] = scopes
 
-    auth_url = (
-        "https://accounts.spotify.com/authorize"
-        f"?response_type=code&client_id={quote(client_id)}"
-        f"&scope={quote(scopes)}"
-        f"&redirect_uri={quote(REDIRECT_URI)}"
-        f"&state={quote(state)}"
-        "&code_challenge_method=S256"
-        f"&code_challenge={quote(challenge)}"
+    # state and challenge are URL-safe base64 already, so only user input needs quoting.
+    scopes_q = _SCOPES_Q if scopes == SCOPES else quote(scopes)
+    auth_url = _AUTH_URL_TMPL.format_map(
+        {"cid": quote(client_id), "sc": scopes_q, "ru": _REDIRECT_URI_Q, "st": state, "ch": challenge}
     )
 
     return redirect(auth_url)
@@ -134,12 +238,16 @@ def start_auth():
 @app.route("/callback")
 def handle_callback():
     returned_state = request.args.get("state")
-    if not returned_state or returned_state != session.get("state"):
-        return jsonify({"error": "Invalid or missing state parameter."}), 400
+    expected_state = session.get("state", "")
+    # Compare as bytes: compare_digest rejects non-ASCII str input.
+    if not returned_state or not hmac.compare_digest(
+        returned_state.encode("utf-8"), expected_state.encode("utf-8")
+    ):
+        return _json_response(_ERR_STATE, 400)
 
     code = request.args.get("code")
     if not code:
-        return jsonify({"error": "Authorization code not found in callback."}), 400
+        return _json_response(_ERR_CODE, 400)
 
     verifier = session.get("verifier")
     payload = {
@@ -150,12 +258,8 @@ def handle_callback():
         "client_secret": session.get("client_secret"),
         "scopes": session.get("scopes", SCOPES),
     }
-    session.pop("state", None)
-    session.pop("verifier", None)
-    session.pop("client_id", None)
-    session.pop("client_secret", None)
-    session.pop("scopes", None)
-    return jsonify(payload)
+    session.clear()
+    return _json_response(orjson.dumps(payload))
 
 
 if __name__ == "__main__":
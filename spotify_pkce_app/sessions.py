@@ -0,0 +1,123 @@
+"""Signed cookie session interface backed by orjson and HMAC-SHA256."""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+
+import orjson
+from flask import Flask, Request, Response
+from flask.sessions import SecureCookieSession, SessionInterface
+
+_SALT = b"spotify-pkce-session"
+
+
+@lru_cache(maxsize=4)
+def _derive_key(secret_key: str | bytes) -> bytes:
+    if isinstance(secret_key, str):
+        secret_key = secret_key.encode("utf-8")
+    return hmac.new(secret_key, _SALT, hashlib.sha256).digest()
+
+
+def _sign(key: bytes, body: bytes) -> bytes:
+    return base64.urlsafe_b64encode(hmac.new(key, body, hashlib.sha256).digest())[:43]
+
+
+class FastSessionInterface(SessionInterface):
+    """Store the session in a cookie as ``payload.timestamp.signature``.
+
+    Drop-in replacement for Flask's default cookie session for the flat string values this
+    app keeps. Signatures are HMAC-SHA256 and cookies older than
+    ``PERMANENT_SESSION_LIFETIME`` are rejected, as with the default interface. Cookies are
+    signed with ``SECRET_KEY`` and also accepted when signed with a key listed in
+    ``SECRET_KEY_FALLBACKS``.
+    """
+
+    session_class = SecureCookieSession
+
+    def open_session(self, app: Flask, request: Request) -> SecureCookieSession | None:
+        if not app.secret_key:
+            return None
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return self.session_class()
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+        data = self._loads(self._get_keys(app), value, max_age)
+        return self.session_class(data or {})
+
+    def save_session(self, app: Flask, session: SecureCookieSession, response: Response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        extra = {}
+        # SESSION_COOKIE_PARTITIONED only exists from Flask 3.1.
+        if hasattr(self, "get_cookie_partitioned"):
+            extra["partitioned"] = self.get_cookie_partitioned(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified:
+                response.delete_cookie(
+                    name,
+                    domain=domain,
+                    path=path,
+                    secure=secure,
+                    samesite=samesite,
+                    httponly=httponly,
+                    **extra,
+                )
+                response.vary.add("Cookie")
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        response.set_cookie(
+            name,
+            self._dumps(_derive_key(app.secret_key), dict(session)),
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+            **extra,
+        )
+        response.vary.add("Cookie")
+
+    @staticmethod
+    def _get_keys(app: Flask) -> list[bytes]:
+        fallbacks = app.config.get("SECRET_KEY_FALLBACKS") or []
+        return [_derive_key(app.secret_key), *(_derive_key(key) for key in fallbacks)]
+
+    @staticmethod
+    def _dumps(key: bytes, data: dict) -> str:
+        payload = base64.urlsafe_b64encode(orjson.dumps(data)).rstrip(b"=")
+        body = b"%s.%d" % (payload, int(time.time()))
+        return (body + b"." + _sign(key, body)).decode("ascii")
+
+    @staticmethod
+    def _loads(keys: list[bytes], value: str, max_age: int) -> dict | None:
+        body, sep, signature = value.encode("utf-8").rpartition(b".")
+        if not sep or not any(hmac.compare_digest(signature, _sign(key, body)) for key in keys):
+            return None
+        payload, sep, timestamp = body.rpartition(b".")
+        if not sep or not timestamp.isdigit():
+            return None
+        # Like itsdangerous, reject timestamps from the future as well as expired ones.
+        age = time.time() - int(timestamp)
+        if age < 0 or age > max_age:
+            return None
+        try:
+            data = orjson.loads(base64.urlsafe_b64decode(payload + b"=" * (-len(payload) % 4)))
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
@@ -0,0 +1,5 @@
+"""WSGI entry point for running the helper under a production server such as gunicorn."""
+
+from .app import app
+
+application = app
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from flask import Flask, session
+
+from spotify_pkce_app import sessions
+from spotify_pkce_app.sessions import FastSessionInterface, _derive_key
+
+
+@pytest.fixture
+def app() -> Flask:
+    app = Flask(__name__)
+    app.secret_key = "test-secret"
+    app.session_interface = FastSessionInterface()
+
+    @app.route("/set")
+    def set_session():
+        session["state"] = "abc"
+        session["verifier"] = "é"
+        return ""
+
+    @app.route("/get")
+    def get_session():
+        return dict(session)
+
+    return app
+
+
+def _session_cookie(client) -> str:
+    return client.get_cookie("session").value
+
+
+def test_round_trip(app):
+    client = app.test_client()
+    client.get("/set")
+    assert client.get("/get").json == {"state": "abc", "verifier": "é"}
+
+
+@pytest.mark.parametrize("part", [0, 2])
+def test_tampered_cookie_gives_empty_session(app, part):
+    client = app.test_client()
+    client.get("/set")
+    pieces = _session_cookie(client).split(".")
+    pieces[part] = pieces[part][:-1] + ("A" if pieces[part][-1] != "A" else "B")
+    client.set_cookie("session", ".".join(pieces))
+    assert client.get("/get").json == {}
+
+
+@pytest.mark.parametrize("future", [False, True])
+def test_expired_cookie_is_rejected(app, monkeypatch, future):
+    client = app.test_client()
+    lifetime = app.permanent_session_lifetime.total_seconds()
+    issued_at = time.time() + 60 if future else time.time() - lifetime - 10
+    monkeypatch.setattr(sessions.time, "time", lambda: issued_at)
+    client.get("/set")
+    monkeypatch.undo()
+    assert client.get("/get").json == {}
+
+
+@pytest.mark.parametrize("value", ["", ".", "abc", "a.b.c", "..", "ü.ü.ü", "e30.notanumber.sig"])
+def test_malformed_cookie_does_not_raise(app, value):
+    client = app.test_client()
+    client.set_cookie("session", value)
+    assert client.get("/get").json == {}
+    assert FastSessionInterface._loads([_derive_key("test-secret")], value, 3600) is None
+
+
+def test_fallback_key_is_accepted(app):
+    client = app.test_client()
+    client.get("/set")
+    app.secret_key = "rotated-secret"
+    assert client.get("/get").json == {}
+    app.config["SECRET_KEY_FALLBACKS"] = ["test-secret"]
+    assert client.get("/get").json == {"state": "abc", "verifier": "é"}
+
+
+def test_partitioned_setting_is_applied(app):
+    if not hasattr(FastSessionInterface, "get_cookie_partitioned"):
+        pytest.skip("SESSION_COOKIE_PARTITIONED requires Flask 3.1")
+    app.config["SESSION_COOKIE_PARTITIONED"] = True
+    response = app.test_client().get("/set")
+    assert "Partitioned" in response.headers["Set-Cookie"]